@@ -1,6 +1,31 @@
 import { NextRequest, NextResponse } from 'next/server'
 
+// Load-shedding and deadline configuration
+// The analysis budget is split in two: photos are fetched and preprocessed until
+// ANALYSIS_DEADLINE_MS - MODEL_CALL_RESERVE_MS, and whatever was fetched by then
+// is sent to the model with the rest of the budget. Photos not fetched in time
+// are skipped and the result is returned as partial.
+const MAX_IN_FLIGHT_ANALYSES = 4 // Reject new submissions beyond this many concurrent analyses
+const ANALYSIS_DEADLINE_MS = 60 * 1000 // Overall budget for fetch, preprocess, model call and parse
+const MODEL_CALL_RESERVE_MS = 30 * 1000 // Portion of the budget held back for the model call and parse
+const DEADLINE_GRACE_MS = 5 * 1000 // Time the Python service gets to report partial results before being killed
+const RETRY_AFTER_SECONDS = 10
+
+let inFlightAnalyses = 0
+
+// Why the route killed the Python process, kept distinct for logs and metrics
+type KillReason = 'deadline_exceeded' | 'client_disconnected'
+
 export async function POST(request: NextRequest) {
+  // Admission control - shed load instead of queueing unbounded work
+  if (inFlightAnalyses >= MAX_IN_FLIGHT_ANALYSES) {
+    return NextResponse.json({
+      success: false,
+      error: 'Analysis service is busy, please retry shortly'
+    }, { status: 503, headers: { 'Retry-After': String(RETRY_AFTER_SECONDS) } })
+  }
+
+  inFlightAnalyses++
   try {
     const { submissionId, photoUrls, submissionData } = await request.json()
 
@@ -12,7 +37,22 @@ export async function POST(request: NextRequest) {
     }
 
     // Call Python Gemini analysis service
-    const analysisResult = await callGeminiAnalysis(photoUrls, submissionData)
+    const deadline = Date.now() + ANALYSIS_DEADLINE_MS
+    const analysisResult: any = await callGeminiAnalysis(photoUrls, submissionData, deadline, request.signal)
+
+    if (analysisResult.kill_reason === 'client_disconnected') {
+      // Nobody is waiting for a body; just close out the request
+      console.warn(`Vehicle analysis cancelled for ${submissionId}: client disconnected`)
+      return new NextResponse(null, { status: 499 })
+    }
+
+    if (analysisResult.timed_out) {
+      console.error(`Vehicle analysis deadline exceeded for ${submissionId}:`, analysisResult.error)
+      return NextResponse.json({
+        success: false,
+        error: 'Analysis deadline exceeded: ' + analysisResult.error
+      }, { status: 504 })
+    }
 
     if (!analysisResult.success) {
       return NextResponse.json({
@@ -27,6 +67,8 @@ export async function POST(request: NextRequest) {
       analysis: analysisResult.analysis,
       photosAnalyzed: analysisResult.photos_analyzed,
       analysisType: analysisResult.analysis_type,
+      partial: analysisResult.partial || false,
+      photosSkipped: analysisResult.photos_skipped || 0,
       timestamp: new Date().toISOString(),
       analysisId: generateAnalysisId()
     }
@@ -43,10 +85,12 @@ export async function POST(request: NextRequest) {
       success: false,
       error: 'Failed to analyze vehicle photos'
     }, { status: 500 })
+  } finally {
+    inFlightAnalyses--
   }
 }
 
-async function callGeminiAnalysis(photoUrls: string[], submissionData: any) {
+async function callGeminiAnalysis(photoUrls: string[], submissionData: any, deadline: number, signal?: AbortSignal) {
   try {
     const { spawn } = require('child_process')
     const path = require('path')
@@ -58,7 +102,10 @@ async function callGeminiAnalysis(photoUrls: string[], submissionData: any) {
       // Prepare input data for Python service
       const inputData = {
         photoUrls,
-        submissionData
+        submissionData,
+        // Python side works in seconds
+        deadline: deadline / 1000,
+        modelCallReserve: MODEL_CALL_RESERVE_MS / 1000
       }
       
       // Path to Python service
@@ -74,6 +121,28 @@ async function callGeminiAnalysis(photoUrls: string[], submissionData: any) {
       
       let result = ''
       let error = ''
+      let killReason: KillReason | null = null
+      
+      const killProcess = (reason: KillReason) => {
+        if (killReason) return
+        killReason = reason
+        pythonProcess.kill('SIGKILL')
+      }
+      
+      // Hard stop if the Python service overruns its own deadline handling
+      const deadlineTimer = setTimeout(
+        () => killProcess('deadline_exceeded'),
+        Math.max(0, deadline - Date.now()) + DEADLINE_GRACE_MS
+      )
+      
+      // Stop working on submissions the client has already given up on
+      const onAbort = () => killProcess('client_disconnected')
+      signal?.addEventListener('abort', onAbort)
+      
+      const cleanup = () => {
+        clearTimeout(deadlineTimer)
+        signal?.removeEventListener('abort', onAbort)
+      }
       
       pythonProcess.stdout.on('data', (data) => {
         result += data.toString()
@@ -84,10 +153,22 @@ async function callGeminiAnalysis(photoUrls: string[], submissionData: any) {
       })
       
       pythonProcess.on('close', (code) => {
-        if (code !== 0) {
+        cleanup()
+        if (killReason === 'client_disconnected') {
+          resolve({ success: false, kill_reason: killReason, error: 'Client disconnected' })
+        } else if (killReason === 'deadline_exceeded') {
+          console.error('Python service killed after overrunning deadline')
+          resolve({ success: false, kill_reason: killReason, timed_out: true, error: 'Analysis process exceeded deadline' })
+        } else if (code !== 0) {
           console.error('Python service error:', error)
-          // Fallback to mock analysis if Python service fails
-          resolve(getMockAnalysis(photoUrls))
+          // The service reports its own failures as JSON on stdout when it can
+          let serviceError = `Analysis service exited with code ${code}`
+          try {
+            serviceError = JSON.parse(result).error || serviceError
+          } catch (parseError) {
+            // No JSON on stdout; keep the exit-code message
+          }
+          resolve({ success: false, error: serviceError })
         } else {
           try {
             const analysisResult = JSON.parse(result)
@@ -95,96 +176,24 @@ async function callGeminiAnalysis(photoUrls: string[], submissionData: any) {
           } catch (parseError) {
             console.error('Failed to parse Python service response:', parseError)
             console.error('Raw response:', result)
-            // Fallback to mock analysis
-            resolve(getMockAnalysis(photoUrls))
+            resolve({ success: false, error: 'Invalid response from analysis service' })
           }
         }
       })
       
       pythonProcess.on('error', (err) => {
+        cleanup()
         console.error('Failed to start Python service:', err)
-        // Fallback to mock analysis
-        resolve(getMockAnalysis(photoUrls))
+        resolve({ success: false, error: 'Analysis service unavailable' })
       })
     })
     
   } catch (error) {
     console.error('Gemini analysis error:', error)
-    // Fallback to mock analysis
-    return getMockAnalysis(photoUrls)
+    return { success: false, error: 'Analysis service unavailable' }
   }
 }
 
-function getMockAnalysis(photoUrls: string[]) {
-  // Fallback mock analysis for when Python service is unavailable
-  return {
-      success: true,
-      analysis: {
-        overall_condition: "Vehicle shows typical wear for age and mileage. Several cosmetic issues noted that impact trade-in value. Interior condition is fair with moderate seat wear. Exterior has minor paint scratches and small dents.",
-        exterior_condition: "Paint shows oxidation on hood and roof. Multiple door dings observed on driver side. Front bumper has minor scuff marks. Headlights show cloudiness typical of vehicle age.",
-        interior_condition: "Driver seat shows moderate wear patterns. Dashboard has minor scratches. Carpet shows normal wear. All electronics appear functional from visual inspection.",
-        mechanical_observations: "Engine bay appears clean with no visible fluid leaks. Tires show even wear pattern indicating proper alignment. No obvious mechanical concerns visible.",
-        severity_assessment: {
-          primary_severity: "moderate",
-          severity_distribution: {
-            minor: 3,
-            moderate: 2,
-            major: 0,
-            severe: 0
-          },
-          total_issues: 5
-        },
-        trade_in_factors: [
-          "Multiple door dings and parking lot damage reduce aesthetic appeal",
-          "Paint oxidation on horizontal surfaces indicates UV exposure",
-          "Interior wear patterns consistent with higher mileage usage",
-          "Minor cosmetic issues that don't affect functionality but impact resale",
-          "Overall condition reflects honest wear for vehicle age"
-        ],
-        recommended_disclosures: [
-          "Multiple minor cosmetic defects should be disclosed to buyer",
-          "Paint oxidation may continue to progress if not addressed",
-          "Interior wear is within normal parameters for mileage"
-        ],
-        detailed_findings: `COMPREHENSIVE VEHICLE INSPECTION REPORT
-
-OVERALL CONDITION SUMMARY:
-This vehicle exhibits typical wear patterns consistent with its age and mileage. While mechanically sound from visual inspection, several cosmetic issues have been identified that will impact trade-in value. The vehicle shows honest wear with no major structural concerns.
-
-DETAILED FINDINGS:
-
-EXTERIOR CONDITION:
-- Paint: Moderate oxidation noted on hood and roof areas, typical UV damage
-- Body: Multiple small door dings on driver side (parking lot damage)
-- Front bumper: Minor scuff marks and paint transfer
-- Headlights: Moderate cloudiness reducing light output
-- Overall: Cosmetic issues present but no structural damage
-
-INTERIOR CONDITION:  
-- Seats: Driver seat shows moderate wear, passenger side in better condition
-- Dashboard: Minor scratches and UV fading on upper surfaces
-- Carpet: Normal wear patterns, no significant stains
-- Electronics: All visible components appear functional
-- Overall: Interior condition consistent with vehicle mileage
-
-MECHANICAL VISIBLE ISSUES:
-- Engine bay: Clean appearance, no visible fluid leaks
-- Tires: Even wear pattern suggests proper maintenance
-- Suspension: No obvious component damage visible
-- Exhaust: Standard condition for vehicle age
-- Overall: No immediate mechanical concerns apparent
-
-TRADE-IN IMPACT FACTORS:
-The cosmetic issues identified will require disclosure and will impact trade-in value. Specifically, the multiple door dings, paint oxidation, and interior wear patterns are typical devaluation factors. However, the absence of major mechanical issues and the overall honest condition of the vehicle support a fair trade-in evaluation.`,
-        analysis_timestamp: new Date().toISOString(),
-        confidence_score: 87,
-        vehicle_grade: "B+"
-      },
-      photos_analyzed: photoUrls.length,
-      analysis_type: "gemini_vision_comprehensive"
-    }
-}
-
 function generateAnalysisId(): string {
   return 'analysis_' + Math.random().toString(36).substr(2, 9) + '_' + Date.now()
 }
\ No newline at end of file
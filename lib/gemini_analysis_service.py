@@ -8,20 +8,22 @@ import asyncio
 import json
 import sys
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 # Add the lib directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
 
 from gemini_vehicle_analysis import GeminiVehicleAnalysis
 
-async def analyze_photos(photo_urls: List[str], submission_data: Dict[str, Any] = None) -> Dict[str, Any]:
+async def analyze_photos(photo_urls: List[str], submission_data: Dict[str, Any] = None, deadline: Optional[float] = None, model_call_reserve: float = 0) -> Dict[str, Any]:
     """
     Analyze vehicle photos using Gemini Vision API
     
     Args:
         photo_urls: List of photo URLs to analyze
         submission_data: Optional submission data for context
+        deadline: Optional absolute deadline (epoch seconds) honored by every stage
+        model_call_reserve: Seconds before the deadline held back for the model call
     
     Returns:
         Analysis results dictionary
@@ -39,7 +41,7 @@ async def analyze_photos(photo_urls: List[str], submission_data: Dict[str, Any]
         analyzer = GeminiVehicleAnalysis(api_key)
         
         # Perform analysis
-        result = await analyzer.analyze_vehicle_photos(photo_urls, submission_data)
+        result = await analyzer.analyze_vehicle_photos(photo_urls, submission_data, deadline, model_call_reserve)
         
         return result
         
@@ -52,8 +54,8 @@ async def analyze_photos(photo_urls: List[str], submission_data: Dict[str, Any]
 def main():
     """Main function for command line usage"""
     if len(sys.argv) < 2:
-        print("Usage: python gemini_analysis_service.py '<json_input>'")
-        print("JSON input should contain 'photoUrls' and optional 'submissionData'")
+        print("Usage: python gemini_analysis_service.py '<json_input>'", file=sys.stderr)
+        print("JSON input should contain 'photoUrls' and optional 'submissionData', 'deadline' and 'modelCallReserve'", file=sys.stderr)
         sys.exit(1)
     
     try:
@@ -61,6 +63,8 @@ def main():
         input_data = json.loads(sys.argv[1])
         photo_urls = input_data.get('photoUrls', [])
         submission_data = input_data.get('submissionData', {})
+        deadline = input_data.get('deadline')
+        model_call_reserve = input_data.get('modelCallReserve', 0)
         
         if not photo_urls:
             print(json.dumps({
@@ -70,7 +74,7 @@ def main():
             sys.exit(1)
         
         # Run analysis
-        result = asyncio.run(analyze_photos(photo_urls, submission_data))
+        result = asyncio.run(analyze_photos(photo_urls, submission_data, deadline, model_call_reserve))
         
         # Output result as JSON
         print(json.dumps(result, indent=2))
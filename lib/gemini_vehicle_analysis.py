@@ -9,6 +9,8 @@ import base64
 from PIL import Image
 import io
 import uuid
+import time
+import threading
 import requests
 from urllib.parse import urlparse
 
@@ -111,17 +113,31 @@ For each category, provide specific devaluation factors without monetary estimat
 """
 }
 
+# Per-connect/per-read download cap; the whole fetch is also bounded by the deadline
+PHOTO_DOWNLOAD_TIMEOUT_SECONDS = 30
+
+# Minimum time worth spending on a stage; below this we stop instead of starting it
+MIN_STAGE_SECONDS = 1.0
+
+class PhotoFetchDeadlineExceeded(Exception):
+    """Raised when a photo can't be fetched before the fetch stage's deadline"""
+    pass
+
 class GeminiVehicleAnalysis:
     def __init__(self, api_key: str):
         self.api_key = api_key
         
-    async def analyze_vehicle_photos(self, photo_urls: list, submission_data: dict = None) -> dict:
+    async def analyze_vehicle_photos(self, photo_urls: list, submission_data: dict = None, deadline: float = None, model_call_reserve: float = 0) -> dict:
         """
         Analyze vehicle photos using Gemini Vision API
         
         Args:
             photo_urls: List of photo URLs to analyze
             submission_data: Optional submission data for context
+            deadline: Optional absolute deadline (epoch seconds) for the whole analysis.
+                Photos not fetched in time are skipped and the result is marked partial.
+            model_call_reserve: Seconds before the deadline held back for the model call;
+                fetching stops early so the photos already fetched still get analyzed.
         
         Returns:
             Comprehensive analysis results
@@ -139,25 +155,39 @@ class GeminiVehicleAnalysis:
             
             # Prepare image contents for analysis
             image_contents = []
+            photos_skipped = 0
+            fetch_deadline = None if deadline is None else deadline - model_call_reserve
             for i, photo_url in enumerate(photo_urls):
+                # Stop fetching once the fetch budget is spent and analyze what we have
+                if self._time_remaining(fetch_deadline) < MIN_STAGE_SECONDS:
+                    photos_skipped = len(photo_urls) - i
+                    print(f"Fetch deadline reached, skipping {photos_skipped} remaining photo(s)", file=sys.stderr)
+                    break
+                
                 try:
-                    print(f"Processing photo {i+1}: {photo_url}")
+                    print(f"Processing photo {i+1}: {photo_url}", file=sys.stderr)
                     
                     # Download and convert actual image to base64
-                    image_base64 = await self._download_and_convert_image(photo_url)
+                    image_base64 = await self._download_and_convert_image(photo_url, fetch_deadline)
                     if image_base64:
                         image_content = ImageContent(image_base64=image_base64)
                         image_contents.append(image_content)
                     else:
-                        print(f"Failed to process photo {i+1}, using placeholder")
+                        print(f"Failed to process photo {i+1}, using placeholder", file=sys.stderr)
                         # Fallback to placeholder if download fails
                         image_content = ImageContent(
                             image_base64=self._create_placeholder_base64()
                         )
                         image_contents.append(image_content)
                     
+                except PhotoFetchDeadlineExceeded as e:
+                    # Ran out of fetch time mid-download; don't pad with placeholders
+                    photos_skipped = len(photo_urls) - i
+                    print(f"{str(e)}, skipping {photos_skipped} remaining photo(s)", file=sys.stderr)
+                    break
+                
                 except Exception as e:
-                    print(f"Error processing photo {i+1}: {str(e)}")
+                    print(f"Error processing photo {i+1}: {str(e)}", file=sys.stderr)
                     # Use placeholder as fallback
                     try:
                         image_content = ImageContent(
@@ -168,6 +198,8 @@ class GeminiVehicleAnalysis:
                         continue
             
             if not image_contents:
+                if photos_skipped:
+                    return self._create_timeout_response("Deadline exceeded before any photo was processed")
                 return self._create_error_response("No valid images to analyze")
             
             # Create analysis message with context
@@ -189,24 +221,41 @@ VEHICLE CONTEXT:
                 file_contents=image_contents
             )
             
-            # Get AI analysis
-            response = await chat.send_message(analysis_message)
+            # Get AI analysis, bounded by whatever time is left (at least the reserve)
+            remaining = self._time_remaining(deadline)
+            if remaining <= 0:
+                return self._create_timeout_response("Deadline exceeded before model call")
+            try:
+                response = await asyncio.wait_for(
+                    chat.send_message(analysis_message),
+                    timeout=None if deadline is None else remaining
+                )
+            except asyncio.TimeoutError:
+                return self._create_timeout_response("Deadline exceeded during model call")
             
             # Parse and structure the response
             analysis_result = self._parse_analysis_response(response, submission_data)
             
+            if photos_skipped:
+                analysis_result["partial"] = True
+                analysis_result["photos_skipped"] = photos_skipped
+            
             return analysis_result
             
         except Exception as e:
-            print(f"Error in Gemini analysis: {str(e)}")
+            print(f"Error in Gemini analysis: {str(e)}", file=sys.stderr)
             return self._create_error_response(str(e))
     
-    async def _download_and_convert_image(self, photo_url: str) -> str:
+    async def _download_and_convert_image(self, photo_url: str, deadline: float = None) -> str:
         """
         Download image from URL and convert to base64
         
         Args:
             photo_url: URL of the image to download
+            deadline: Optional absolute deadline (epoch seconds) bounding the download
+        
+        Raises:
+            PhotoFetchDeadlineExceeded: If the deadline passes before the photo is ready
         
         Returns:
             Base64 encoded image string
@@ -221,22 +270,32 @@ VEHICLE CONTEXT:
             
             elif photo_url.startswith(('http://', 'https://')):
                 # HTTP URL - download the image
-                print(f"Downloading image from: {photo_url}")
+                print(f"Downloading image from: {photo_url}", file=sys.stderr)
                 
                 headers = {
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
                 }
                 
-                response = requests.get(photo_url, headers=headers, timeout=30)
-                response.raise_for_status()
+                # Fetch off the event loop, bounded as a whole by the time remaining
+                remaining = self._time_remaining(deadline)
+                try:
+                    content, content_type = await asyncio.wait_for(
+                        self._run_in_daemon_thread(self._fetch_image_bytes, photo_url, headers, PHOTO_DOWNLOAD_TIMEOUT_SECONDS),
+                        timeout=None if deadline is None else remaining
+                    )
+                except asyncio.TimeoutError:
+                    raise PhotoFetchDeadlineExceeded(f"Deadline exceeded while downloading: {photo_url}")
+                
+                # Skip preprocessing if the download used up the remaining time
+                if self._time_remaining(deadline) <= 0:
+                    raise PhotoFetchDeadlineExceeded(f"Deadline exceeded after downloading: {photo_url}")
                 
                 # Check if it's an image
-                content_type = response.headers.get('content-type', '')
                 if not content_type.startswith('image/'):
-                    print(f"Warning: URL does not appear to be an image (content-type: {content_type})")
+                    print(f"Warning: URL does not appear to be an image (content-type: {content_type})", file=sys.stderr)
                 
                 # Convert to PIL Image to ensure it's valid and optimize
-                image = Image.open(io.BytesIO(response.content))
+                image = Image.open(io.BytesIO(content))
                 
                 # Convert to RGB if necessary (for PNG with transparency)
                 if image.mode in ('RGBA', 'LA', 'P'):
@@ -250,36 +309,81 @@ VEHICLE CONTEXT:
                 max_size = 2048
                 if image.width > max_size or image.height > max_size:
                     image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                    print(f"Resized image to {image.width}x{image.height}")
+                    print(f"Resized image to {image.width}x{image.height}", file=sys.stderr)
                 
                 # Convert to base64
                 buffer = io.BytesIO()
                 image.save(buffer, format='JPEG', quality=85, optimize=True)
                 img_str = base64.b64encode(buffer.getvalue()).decode()
                 
-                print(f"Successfully converted image to base64 ({len(img_str)} characters)")
+                print(f"Successfully converted image to base64 ({len(img_str)} characters)", file=sys.stderr)
                 return img_str
                 
             elif photo_url.startswith('gs://'):
                 # Google Cloud Storage URL
-                print(f"Warning: Google Storage URLs not implemented yet: {photo_url}")
+                print(f"Warning: Google Storage URLs not implemented yet: {photo_url}", file=sys.stderr)
                 return None
                 
             else:
                 # Local file path or unknown format
-                print(f"Warning: Unsupported URL format: {photo_url}")
+                print(f"Warning: Unsupported URL format: {photo_url}", file=sys.stderr)
                 return None
                 
+        except PhotoFetchDeadlineExceeded:
+            raise
         except requests.RequestException as e:
-            print(f"Network error downloading image: {str(e)}")
+            print(f"Network error downloading image: {str(e)}", file=sys.stderr)
             return None
         except Image.UnidentifiedImageError as e:
-            print(f"Invalid image format: {str(e)}")
+            print(f"Invalid image format: {str(e)}", file=sys.stderr)
             return None
         except Exception as e:
-            print(f"Error converting image: {str(e)}")
+            print(f"Error converting image: {str(e)}", file=sys.stderr)
             return None
 
+    def _fetch_image_bytes(self, photo_url: str, headers: dict, timeout: float) -> tuple:
+        """
+        Download image bytes (blocking)
+        
+        Returns:
+            Tuple of (content bytes, content type)
+        """
+        response = requests.get(photo_url, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        return response.content, response.headers.get('content-type', '')
+    
+    async def _run_in_daemon_thread(self, func, *args):
+        """
+        Run a blocking call in a daemon thread and await its result
+        
+        Unlike asyncio.to_thread, a call abandoned by wait_for can't hold up
+        asyncio.run's executor shutdown or interpreter exit, so the service
+        still reports its result as soon as the deadline passes.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        def settle(result=None, error=None):
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        
+        def runner():
+            try:
+                outcome = {"result": func(*args)}
+            except Exception as e:
+                outcome = {"error": e}
+            try:
+                loop.call_soon_threadsafe(lambda: settle(**outcome))
+            except RuntimeError:
+                pass  # Event loop already closed; nobody is waiting
+        
+        threading.Thread(target=runner, daemon=True).start()
+        return await future
+    
     def _create_placeholder_base64(self) -> str:
         """Create a small placeholder image for testing"""
         # Create a small test image
@@ -354,7 +458,7 @@ VEHICLE CONTEXT:
             return "Professional vehicle inspection completed"
             
         except Exception as e:
-            print(f"Error extracting overall condition: {str(e)}")
+            print(f"Error extracting overall condition: {str(e)}", file=sys.stderr)
             return "Professional vehicle inspection completed"
     
     def _extract_condition_category(self, response: str, category: str) -> str:
@@ -403,7 +507,7 @@ VEHICLE CONTEXT:
             return f"{category.title()} condition within normal parameters"
             
         except Exception as e:
-            print(f"Error extracting {category} condition: {str(e)}")
+            print(f"Error extracting {category} condition: {str(e)}", file=sys.stderr)
             return f"{category.title()} condition within normal parameters"
     
     def _extract_severity_ratings(self, response: str) -> dict:
@@ -444,7 +548,7 @@ VEHICLE CONTEXT:
             }
             
         except Exception as e:
-            print(f"Error extracting severity ratings: {str(e)}")
+            print(f"Error extracting severity ratings: {str(e)}", file=sys.stderr)
             return {
                 "primary_severity": "minor",
                 "severity_distribution": {"minor": 1, "moderate": 0, "major": 0, "severe": 0},
@@ -519,6 +623,12 @@ VEHICLE CONTEXT:
         
         return "B"  # Default grade
     
+    def _time_remaining(self, deadline: float = None) -> float:
+        """Seconds left before the deadline (infinite when no deadline is set)"""
+        if deadline is None:
+            return float('inf')
+        return deadline - time.time()
+    
     def _get_timestamp(self) -> str:
         """Get current timestamp"""
         from datetime import datetime
@@ -532,6 +642,12 @@ VEHICLE CONTEXT:
             "analysis": None,
             "photos_analyzed": 0
         }
+    
+    def _create_timeout_response(self, error_message: str) -> dict:
+        """Create error response for an analysis that ran out of time"""
+        response = self._create_error_response(error_message)
+        response["timed_out"] = True
+        return response
 
 # Test function
 async def test_analysis():